@@ -1,168 +1,823 @@
+import contextlib
+import datetime
+import functools
+import hashlib
+import json
+import math
+import operator
 import os
+import queue
+import re
+import select
+import sys
 import threading
 import time
-from typing import Dict, List
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import colorama
 import google.generativeai as genai
+import orjson
 from colorama import Fore, Style
 from dotenv import load_dotenv
+from google.generativeai import caching
 
 from fastapi import FastAPI
 from pydantic import BaseModel
 from typing import List
 
+if os.name == "nt":
+    import msvcrt
+else:
+    import termios
+    import tty
+
+colorama.init()  # Initialize colorama for colored text (once per process)
+load_dotenv()  # Load environment variables from .env (once per process)
+
 app = FastAPI()
 
+
 class QuizRequest(BaseModel):
     topic: str
     question_number: int
     level: str
 
+# Response schema used in JSON mode: a list of question objects
+QUIZ_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "question": {"type": "STRING"},
+            "code": {"type": "STRING"},
+            "options": {
+                "type": "OBJECT",
+                "properties": {opt: {"type": "STRING"} for opt in "ABCD"},
+                "required": list("ABCD"),
+            },
+            "correct": {"type": "STRING", "enum": list("ABCD")},
+            "explanation": {"type": "STRING"},
+        },
+        "required": ["question", "options", "correct", "explanation"],
+    },
+}
+
+# One "Qn." question block in the text format requested by QuizAgent.quiz_prompts.
+# The number may carry Markdown such as "**Q2.**" or "## Q2." and still starts a block.
+QUESTION_BLOCK_RE = re.compile(
+    r"^[ \t*#_]*Q\d+\.[*_]*[ \t]*(?P<body>.+?)(?=\n[ \t*#_]*Q\d+\.|\Z)",
+    re.DOTALL | re.MULTILINE,
+)
+
+# One labeled line of a question block ("A) ...", "Correct: ...", "Explanation: ..."),
+# together with any wrapped continuation lines up to the next label
+FIELD_RE = re.compile(
+    r"^[ \t]*(?:(?P<opt>[A-D])\)|(?P<label>Correct|Explanation):)[ \t]*"
+    r"(?P<value>.*(?:\n(?![ \t]*(?:[A-D]\)|Correct:|Explanation:)).*)*)",
+    re.MULTILINE,
+)
+
+# Fenced Python snippet inside a question block
+CODE_RE = re.compile(r"```(?:python)?[ \t]*\n(.*?)\n\s*```", re.DOTALL)
+
+# Terminal escape sequences (arrow keys, function keys) and lone escape bytes
+ESCAPE_RE = re.compile(rb"\x1b(?:\[[0-?]*[ -/]*[@-~]|O.)?")
+
+# Context caching needs an explicitly versioned model
+CONTEXT_CACHE_MODEL = "models/gemini-1.5-flash-002"
+
+# Lifetime of a context cache on Gemini's side; shared caches are recreated after it
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+
+# Decoder used to pull complete objects out of a partially streamed JSON array
+_JSON_DECODER = json.JSONDecoder()
+
+# Follow-up requests allowed for questions missing from a short response
+MAX_TOP_UP_ATTEMPTS = 3
+
+# Largest number of questions asked for in one blocking request; bigger quizzes
+# and top-ups are split into parallel requests
+QUESTIONS_PER_REQUEST = 5
+
+# How many earlier question stems are listed in the prompt as "do not repeat"
+RECENT_STEMS_IN_PROMPT = 20
+
+# Extra questions requested on top of the asked-for count, so a few malformed or
+# repeated ones can be dropped without a follow-up request
+QUESTION_SLACK = 2
+
+# Stands in for a template's text layout in JSON mode, where the response schema
+# already fixes the structure
+JSON_FORMAT_NOTE = """
+Return the questions as a JSON array using the fields question, code (empty string
+when there is no snippet), options (A-D), correct and explanation.
+"""
+
+# Gemini client state shared by every QuizAgent in the process
+GEMINI_API_ENDPOINT = "generativelanguage.googleapis.com"
+_CONFIGURED = False
+_WARMED = False
+_MODELS: Dict[bool, genai.GenerativeModel] = {}
+# Context-cached models per (level, json_mode) with their creation time; the
+# model is None when Gemini refused the cache
+_CONTEXT_MODELS: Dict[Tuple[str, bool], Tuple[float, Optional[genai.GenerativeModel]]] = {}
+# One lock per context cache key, so an upload only blocks requests for that cache
+_CONTEXT_LOCKS: Dict[Tuple[str, bool], threading.Lock] = {}
+_LOCK = threading.Lock()
+
+# Per-thread state; a run_quiz producer thread keeps its stop event here
+_THREAD_STATE = threading.local()
+
+# Layout version of cached questions; entries written with another version are ignored
+CACHE_VERSION = 2
+
+# Most prompts kept in the in-process copy of the quiz cache
+MEMORY_CACHE_SIZE = 512
+
+# In-process LRU copy of the quiz cache: request key -> (timestamp, questions).
+# The questions are private copies; callers only ever get copies of them back.
+_MEMORY_CACHE: "OrderedDict[str, Tuple[float, Tuple[Dict, ...]]]" = OrderedDict()
+_MEMORY_LOCK = threading.Lock()
+
+
+def _memory_get(key: str) -> Optional[Tuple[float, Tuple[Dict, ...]]]:
+    """Look up a request key in the in-process cache, marking it most recently used."""
+    with _MEMORY_LOCK:
+        entry = _MEMORY_CACHE.get(key)
+        if entry is not None:
+            _MEMORY_CACHE.move_to_end(key)
+        return entry
+
+
+def _memory_put(key: str, entry: Tuple[float, Tuple[Dict, ...]]):
+    """Add an entry to the in-process cache, evicting the least recently used beyond MEMORY_CACHE_SIZE."""
+    with _MEMORY_LOCK:
+        _MEMORY_CACHE[key] = entry
+        _MEMORY_CACHE.move_to_end(key)
+        while len(_MEMORY_CACHE) > MEMORY_CACHE_SIZE:
+            _MEMORY_CACHE.popitem(last=False)
+
+
+def _normalize_topic(topic: str) -> str:
+    """Fold case and whitespace so differently typed topics share a prompt and cache entry."""
+    return " ".join(topic.split()).lower()
+
+
+def _shared_model(api_key: str, json_mode: bool, generation_config: Optional[Dict]) -> genai.GenerativeModel:
+    """Configure Gemini once and return the process-wide model for the given output mode."""
+    global _CONFIGURED
+    with _LOCK:
+        if not _CONFIGURED:
+            # A single gRPC channel is reused so the TLS handshake is paid once
+            genai.configure(
+                api_key=api_key,
+                transport="grpc",
+                client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+            )
+            _CONFIGURED = True
+        if json_mode not in _MODELS:
+            _MODELS[json_mode] = genai.GenerativeModel("gemini-1.5-flash", generation_config=generation_config)
+        return _MODELS[json_mode]
+
+
+def _warm_up(model: genai.GenerativeModel):
+    """Open the shared gRPC channel in the background with a one-token request."""
+    global _WARMED
+    with _LOCK:
+        if _WARMED:
+            return
+        _WARMED = True
+
+    def ping():
+        try:
+            model.generate_content("ping", generation_config={"max_output_tokens": 1})
+        except Exception:
+            pass  # the first real request will connect and report errors itself
+
+    threading.Thread(target=ping, daemon=True).start()
+
+
+def _wait_key_posix(timeout: float) -> Optional[str]:
+    """Return the keys typed on a cbreak-mode stdin, or None after timeout seconds.
+
+    Returns "" only at end of input; keys that can't be an answer come back as None.
+    """
+    ready, _, _ = select.select([sys.stdin], [], [], timeout)
+    if not ready:
+        return None
+    # Read everything pending so a multi-byte key arrives whole
+    data = os.read(sys.stdin.fileno(), 32)
+    if not data:
+        return ""
+    # Escape sequences and non-ASCII characters are never answers
+    return ESCAPE_RE.sub(b"", data).decode("ascii", errors="ignore") or None
+
+
+# Bytes read from piped stdin that haven't been returned as a line yet
+_LINE_BUFFER = bytearray()
+
+
+def _wait_line(timeout: float) -> Optional[str]:
+    """Return one line from stdin, or None after timeout seconds."""
+    # Read the fd directly: select can't see lines already pulled into sys.stdin's buffer
+    if b"\n" not in _LINE_BUFFER:
+        ready, _, _ = select.select([sys.stdin], [], [], timeout)
+        if not ready:
+            return None
+        data = os.read(sys.stdin.fileno(), 4096)
+        if not data:
+            if not _LINE_BUFFER:
+                return ""
+            data = b"\n"  # end of input terminates the last partial line
+        _LINE_BUFFER.extend(data)
+        if b"\n" not in _LINE_BUFFER:
+            return None
+
+    end = _LINE_BUFFER.index(b"\n") + 1
+    line = _LINE_BUFFER[:end].decode(errors="ignore")
+    del _LINE_BUFFER[:end]
+    return line
+
+
+def _discard_keys_posix():
+    """Throw away keys typed on the terminal before the current question was shown."""
+    termios.tcflush(sys.stdin.fileno(), termios.TCIFLUSH)
+
+
+def _discard_keys_windows():
+    """Throw away keys typed in the console before the current question was shown."""
+    while msvcrt.kbhit():
+        msvcrt.getwch()
+
+
+def _discard_nothing():
+    """Piped answers are meant for later questions, so nothing is discarded."""
+
+
+def _wait_key_windows(timeout: float) -> Optional[str]:
+    """Return one keystroke from the Windows console, or None after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if msvcrt.kbhit():
+            key = msvcrt.getwch()
+            if key in ("\x00", "\xe0"):
+                # Function and arrow keys arrive as a prefix plus a code (F7-F10 send A-D)
+                msvcrt.getwch()
+                return None
+            return key
+        time.sleep(0.05)
+    return None
+
+
 class QuizAgent:
-    def __init__(self):
-        colorama.init()  # Initialize colorama for colored text
+    # Countdown line repainted every second while waiting for an answer
+    _TIMER_FMT = f"{Fore.YELLOW}\rTime remaining: %2d seconds {Style.RESET_ALL}"
 
-        # Load environment variables
-        load_dotenv()
+    # Accepted answer keys, in either case
+    _VALID_ANSWERS = frozenset("ABCDabcd")
+
+    # Different prompts based on difficulty level
+    quiz_prompts = {
+        "beginner": """Generate {num_questions} multiple-choice questions about {topic} in Python at {level} level.
+        Each question must strictly follow this format:
+        
+        Q1. [Conceptual Question text]
+        A) [Option A]
+        B) [Option B]
+        C) [Option C]
+        D) [Option D]
+        Correct: [Correct option letter]
+        Explanation: [Detailed explanation]
+        
+        Ensure exactly {num_questions} conceptual questions are generated with correct formatting. Do not include code snippets.
+        """,
+        "intermediate": """Generate {num_questions} multiple-choice questions about {topic} in Python at {level} level.
+        Each question must strictly follow this format:
+        
+        Q1. [Question text]
+        ```python
+        [Code snippet]
+        ```
+        A) [Option A]
+        B) [Option B]
+        C) [Option C]
+        D) [Option D]
+        Correct: [Correct option letter]
+        Explanation: [Detailed explanation]
+        
+        Ensure exactly {num_questions} questions are generated with correct formatting.
+        """,
+        "advanced": """Generate {num_questions} multiple-choice conceptual questions about {topic} in Python at {level} level.
+         Each question must strictly follow this format:
+
+         Q1. [Conceptual Question text]
+         A) [Option A]
+         B) [Option B]
+         C) [Option C]
+         D) [Option D]
+         Correct: [Correct option letter]
+         Explanation: [Detailed explanation]
+
+         Ensure exactly {num_questions} conceptual questions are generated with correct formatting. Do not include code snippets.
+         """
+        
+    }
+
+    def __init__(
+        self,
+        cache_path: str = ".quiz_cache",
+        cache_ttl: int = 24 * 60 * 60,
+        json_mode: bool = True,
+        context_cache: bool = False,
+        warm_up: bool = False,
+    ):
         self.gemini_api_key = os.getenv("GEMINI_API_KEY")
         if not self.gemini_api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set.")
 
-        # Configure Gemini API
-        genai.configure(api_key=self.gemini_api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
+        # Configure Gemini API (once per process, shared across agents)
+        self.json_mode = json_mode
+        if json_mode:
+            # Ask for schema-constrained JSON so no text parsing/retry is needed
+            self.generation_config = {
+                "response_mime_type": "application/json",
+                "response_schema": QUIZ_SCHEMA,
+            }
+        else:
+            self.generation_config = None
+        self.model = _shared_model(self.gemini_api_key, json_mode, self.generation_config)
+        if warm_up:
+            # Pay the TLS/gRPC handshake now rather than on the first quiz request
+            _warm_up(self.model)
 
         # Quiz settings
         self.difficulty_levels = ["beginner", "intermediate", "advanced"]
         self.time_limits = {"beginner": 30, "intermediate": 45, "advanced": 60}
 
-        # Different prompts based on difficulty level
-        self.quiz_prompts = {
-            "beginner": """Generate {num_questions} multiple-choice questions about {topic} in Python at {level} level.
-            Each question must strictly follow this format:
-            
-            Q1. [Conceptual Question text]
-            A) [Option A]
-            B) [Option B]
-            C) [Option C]
-            D) [Option D]
-            Correct: [Correct option letter]
-            Explanation: [Detailed explanation]
-            
-            Ensure exactly {num_questions} conceptual questions are generated with correct formatting. Do not include code snippets.
-            """,
-            "intermediate": """Generate {num_questions} multiple-choice questions about {topic} in Python at {level} level.
-            Each question must strictly follow this format:
-            
-            Q1. [Question text]
-            ```python
-            [Code snippet]
-            ```
-            A) [Option A]
-            B) [Option B]
-            C) [Option C]
-            D) [Option D]
-            Correct: [Correct option letter]
-            Explanation: [Detailed explanation]
-            
-            Ensure exactly {num_questions} questions are generated with correct formatting.
-            """,
-            "advanced": """Generate {num_questions} multiple-choice conceptual questions about {topic} in Python at {level} level.
-             Each question must strictly follow this format:
-
-             Q1. [Conceptual Question text]
-             A) [Option A]
-             B) [Option B]
-             C) [Option C]
-             D) [Option D]
-             Correct: [Correct option letter]
-             Explanation: [Detailed explanation]
-
-             Ensure exactly {num_questions} conceptual questions are generated with correct formatting. Do not include code snippets.
-             """
-            
+        # On-disk response cache (one JSON file per request key)
+        self.cache_path = Path(cache_path)
+        self.cache_ttl = cache_ttl
+
+        # Questions asked so far, used to keep repeated quizzes from overlapping
+        self._seen_question_hashes = set()
+        self._recent_stems = deque(maxlen=RECENT_STEMS_IN_PROMPT)
+
+        # Warnings from the producer thread, held while a quiz is on screen
+        self._held_warnings: Optional[queue.SimpleQueue] = None
+
+        # Server-side context caches holding each level's static instructions
+        self.context_cache = context_cache
+        if context_cache:
+            for level in self.difficulty_levels:
+                self._context_model(level)
+
+    def _context_model(self, level: str) -> Optional[genai.GenerativeModel]:
+        """Return the process-wide context-cached model for a level, creating it on first use."""
+        key = (level, self.json_mode)
+        entry = _CONTEXT_MODELS.get(key)
+        if self._context_fresh(entry):
+            return entry[1]
+
+        with _LOCK:
+            key_lock = _CONTEXT_LOCKS.setdefault(key, threading.Lock())
+        # The upload is a network call, so it runs under the per-key lock only;
+        # re-check in case another agent refreshed the cache while we waited
+        with key_lock:
+            entry = _CONTEXT_MODELS.get(key)
+            if not self._context_fresh(entry):
+                entry = (time.monotonic(), self._create_context_cache(level))
+                _CONTEXT_MODELS[key] = entry
+        return entry[1]
+
+    @staticmethod
+    def _context_fresh(entry: Optional[Tuple[float, Optional[genai.GenerativeModel]]]) -> bool:
+        """Whether a shared context cache entry can still be used."""
+        # Leave a minute of headroom so a request never hits an expired cache
+        return entry is not None and time.monotonic() - entry[0] <= CONTEXT_CACHE_TTL.total_seconds() - 60
+
+    def _create_context_cache(self, level: str) -> Optional[genai.GenerativeModel]:
+        """Upload the static instructions for a level to Gemini's context cache."""
+        # Placeholders are replaced by generic wording so the cached text is per-level constant
+        instructions = self._format_prompt(level, "the requested topic", "the requested number of", self.json_mode)
+        instructions += "\nThe request will give topic, level and num_questions values."
+
+        try:
+            cache = caching.CachedContent.create(
+                model=CONTEXT_CACHE_MODEL,
+                display_name=f"quiz-{level}",
+                system_instruction=instructions,
+                ttl=CONTEXT_CACHE_TTL,
+            )
+        except Exception as e:
+            # Gemini rejects caches below its minimum token count; use plain prompts then
+            self._warn(Fore.YELLOW + f"Context cache unavailable for {level} level: {e}" + Style.RESET_ALL)
+            return None
+
+        return genai.GenerativeModel.from_cached_content(cache, generation_config=self.generation_config)
+
+    def _cache_key(self, topic: str, level: str, num_questions: int) -> Optional[str]:
+        """Quiz cache key for a request, or None when the request shouldn't be cached."""
+        # Once this session has asked questions the prompt carries its own "do not
+        # repeat" list, and entries keyed on it would never be hit again
+        if self._recent_stems:
+            return None
+        # Keyed on the request itself: the prompt text actually sent differs with
+        # QUESTION_SLACK, fan-out hints and context caching
+        request = f"{level}\0{_normalize_topic(topic)}\0{num_questions}\0{self.json_mode}"
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _warn(self, message: str):
+        """Print a warning, or hold it while run_quiz has a countdown on screen."""
+        # A producer whose quiz has ended has no one left to warn
+        stop = getattr(_THREAD_STATE, "stop", None)
+        if stop is not None and stop.is_set():
+            return
+        # run_quiz may reset the attribute concurrently, so read it once
+        held = self._held_warnings
+        if held is not None:
+            held.put(message)
+        else:
+            print(message)
+
+    def _print_held_warnings(self):
+        """Print warnings held back during run_quiz."""
+        while True:
+            try:
+                print(self._held_warnings.get_nowait())
+            except queue.Empty:
+                return
+
+    def _load_cached(self, key: Optional[str]) -> Optional[List[Dict]]:
+        """Return cached questions for a request key, or None if missing or expired."""
+        if key is None:
+            return None
+        # Memory first, so repeat requests in this process skip the file read too
+        entry = _memory_get(key)
+        if entry is None:
+            try:
+                data = orjson.loads((self.cache_path / f"{key}.json").read_bytes())
+            except (OSError, ValueError):
+                return None
+            if data.get("version") != CACHE_VERSION or not data.get("questions"):
+                return None
+            # JSON has no tuples, so restore the options tuple fresh questions carry
+            questions = tuple({**q, "options": tuple(q["options"])} for q in data["questions"])
+            entry = (data.get("ts", 0), questions)
+            _memory_put(key, entry)
+
+        ts, questions = entry
+        if time.time() - ts > self.cache_ttl:
+            return None
+        # Copies, so a caller editing its quiz can't change what other agents get
+        return [dict(q) for q in questions]
+
+    def _store_cached(self, key: Optional[str], questions: List[Dict]):
+        """Write parsed questions to the on-disk cache, stamped with the current time."""
+        if key is None:
+            return
+        ts = time.time()
+        _memory_put(key, (ts, tuple(dict(q) for q in questions)))
+        try:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            (self.cache_path / f"{key}.json").write_bytes(
+                orjson.dumps({"version": CACHE_VERSION, "ts": ts, "questions": questions})
+            )
+        except OSError as e:
+            self._warn(Fore.YELLOW + f"Could not write quiz cache: {e}" + Style.RESET_ALL)
+
+    def clear_cache(self):
+        """Drop every cached quiz, in memory and on disk."""
+        with _MEMORY_LOCK:
+            _MEMORY_CACHE.clear()
+        for path in self.cache_path.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+    def _question_from_json(self, q: Dict) -> Optional[Dict]:
+        """Normalize one decoded JSON question, or return None if it is malformed."""
+        try:
+            return {
+                "question": q["question"].strip(),
+                "code": (q.get("code") or "").strip(),
+                "options": tuple(q["options"][opt].strip() for opt in "ABCD"),
+                "correct": q["correct"].strip().upper(),
+                "explanation": q["explanation"].strip(),
+            }
+        except (KeyError, TypeError, AttributeError) as e:
+            self._warn(Fore.YELLOW + f"Skipping poorly formatted question: {e}" + Style.RESET_ALL)
+            return None
+
+    def _question_from_block(self, block: str) -> Optional[Dict]:
+        """Build a question dict from one text block, or return None if fields are missing."""
+        # Intermediate questions carry a fenced code snippet after the question line;
+        # cutting it out by its span avoids a second regex pass over the block
+        code_match = CODE_RE.search(block)
+        if code_match:
+            block = block[: code_match.start()] + block[code_match.end() :]
+
+        # One finditer pass over the labeled fields; field order doesn't matter and
+        # anything before the first label is the question text
+        fields = {}
+        first = None
+        for m in FIELD_RE.finditer(block):
+            if first is None:
+                first = m.start()
+            name = m["opt"] or m["label"].lower()
+            if name in fields:
+                # A repeated label means two questions ran together; don't guess which is which
+                self._warn(Fore.YELLOW + "Skipping question block with repeated fields." + Style.RESET_ALL)
+                return None
+            value = "\n".join(line.strip() for line in m["value"].split("\n") if line.strip())
+            fields[name] = value[:1].upper() if name == "correct" else value
+        question = "\n".join(line.strip() for line in block[:first].split("\n") if line.strip())
+
+        if fields.get("correct") not in ("A", "B", "C", "D") or not all(k in fields for k in "ABCD"):
+            self._warn(Fore.YELLOW + "Skipping poorly formatted question block." + Style.RESET_ALL)
+            return None
+
+        return {
+            "question": question,
+            "code": code_match.group(1) if code_match else "",
+            "options": tuple(fields[opt] for opt in "ABCD"),
+            "correct": fields["correct"],
+            "explanation": fields.get("explanation", ""),
         }
-    @app.post("/generate-quiz")
-    def generate_quiz(self, topic: str, level: str, num_questions: int) -> List[Dict]:
-        """Generate quiz questions using Gemini API."""
-        prompt = self.quiz_prompts[level].format(topic=topic, level=level, num_questions=num_questions)
-        response = self.model.generate_content(prompt)                                #80                  
+
+    def _parse_json(self, text: str) -> List[Dict]:
+        """Parse a JSON-mode response into question dicts."""
+        try:
+            raw_questions = orjson.loads(text)
+        except ValueError as e:
+            self._warn(Fore.RED + f"❌ Error parsing quiz JSON: {e}" + Style.RESET_ALL)
+            return []
+
+        questions = [self._question_from_json(q) for q in raw_questions]
+        return [q for q in questions if q is not None]
+
+    def _parse_text(self, text: str) -> List[Dict]:
+        """Parse a free-form text response into question dicts."""
+        questions = [self._question_from_block(m["body"]) for m in QUESTION_BLOCK_RE.finditer(text)]
+        return [q for q in questions if q is not None]
+
+    def _parse_partial(self, buffer: str, pos: int, final: bool) -> Tuple[List[Dict], int]:
+        """Parse the questions completed in buffer[pos:], returning them and the new offset."""
+        questions = []
+        if self.json_mode:
+            while True:
+                # Skip the array punctuation between objects
+                while pos < len(buffer) and buffer[pos] in "[,] \t\r\n":
+                    pos += 1
+                try:
+                    raw, pos = _JSON_DECODER.raw_decode(buffer, pos)
+                except ValueError:
+                    break  # the next object hasn't fully arrived yet
+                q = self._question_from_json(raw)
+                if q is not None:
+                    questions.append(q)
+        else:
+            for m in QUESTION_BLOCK_RE.finditer(buffer, pos):
+                if m.end() == len(buffer) and not final:
+                    break  # the block may still be streaming in
+                q = self._question_from_block(m["body"])
+                if q is not None:
+                    questions.append(q)
+                pos = m.end()
+        return questions, pos
+
+    def _stream_questions(self, model: genai.GenerativeModel, request: str) -> Iterator[Dict]:
+        """Yield questions from a streamed Gemini response as soon as each one is complete."""
+        buffer = ""
+        pos = 0
+        for chunk in model.generate_content(request, stream=True):
+            buffer += chunk.text
+            questions, pos = self._parse_partial(buffer, pos, final=False)
+            yield from questions
+
+        questions, _ = self._parse_partial(buffer, pos, final=True)
+        yield from questions
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _format_prompt(level: str, topic: str, num_questions: int, json_mode: bool) -> str:
+        """Format a level's prompt template; memoized since the templates are constant."""
+        template = QuizAgent.quiz_prompts[level]
+        if json_mode:
+            # Keep the request and closing rule lines; the text layout in between
+            # only costs input tokens and contradicts the JSON schema
+            lines = [line.strip() for line in template.strip().split("\n")]
+            template = lines[0] + "\n" + JSON_FORMAT_NOTE
+            if "```python" in lines:
+                template += "Each question must include a Python code snippet in code.\n"
+            template += lines[-1]
+        return template.format(topic=topic, level=level, num_questions=num_questions)
+
+    def _build_prompt(self, topic: str, level: str, num_questions: int) -> str:
+        """Format the prompt for a quiz request."""
+        return self._format_prompt(level, _normalize_topic(topic), num_questions, self.json_mode) + self._avoid_note()
+
+    def _avoid_note(self) -> str:
+        """Prompt suffix listing recent question stems the model should not repeat."""
+        if not self._recent_stems:
+            return ""
+        return "\nDo not repeat any of these question stems: " + "; ".join(self._recent_stems)
+
+    def _dedupe(self, questions: List[Dict], limit: Optional[int] = None) -> List[Dict]:
+        """Drop questions already seen in this session and remember up to limit new ones."""
+        fresh = []
+        for q in questions:
+            if limit is not None and len(fresh) == limit:
+                break
+            key = hash(q["question"].strip().lower())
+            if key in self._seen_question_hashes:
+                continue
+            self._seen_question_hashes.add(key)
+            self._recent_stems.append(q["question"])
+            fresh.append(q)
+        return fresh
+
+    def _request_for(self, topic: str, level: str, num_questions: int) -> Tuple[genai.GenerativeModel, str]:
+        """Return the model to call and the prompt to send it for a quiz request."""
+        model = self._context_model(level) if self.context_cache else None
+        if model is not None:
+            # The instructions already live in the cached context; send only the variables
+            return model, f"topic={_normalize_topic(topic)} level={level} num_questions={num_questions}" + self._avoid_note()
+        return self.model, self._build_prompt(topic, level, num_questions)
+
+    def _parse_response(self, text: str) -> List[Dict]:
+        """Parse a Gemini response with the parser matching the output mode."""
+        if self.json_mode:
+            return self._parse_json(text)
+        return self._parse_text(text)
+
+    def _request_questions(self, topic: str, level: str, num_questions: int, hint: str = "") -> List[Dict]:
+        """Make a single Gemini request for num_questions questions and parse the response."""
+        model, request = self._request_for(topic, level, num_questions)
+        response = model.generate_content(request + hint)                         #80                  
 
         if not response.text:
             raise Exception("Failed to generate quiz questions.")
+        return self._parse_response(response.text)
+
+    def _raw_generate(self, topic: str, level: str, num_questions: int) -> List[Dict]:
+        """Make a single Gemini request and return up to num_questions new questions."""
+        return self._dedupe(self._request_questions(topic, level, num_questions + QUESTION_SLACK), num_questions)
+
+    def _top_up(self, topic: str, level: str, missing: int) -> List[Dict]:
+        """Request missing questions as parallel calls of at most QUESTIONS_PER_REQUEST each.
+
+        Also serves the first request of generate_quiz, where every question is missing.
+        """
+        if missing <= QUESTIONS_PER_REQUEST:
+            return self._raw_generate(topic, level, missing)
+
+        # ceil(missing / QUESTIONS_PER_REQUEST) requests; the slack rides on the last one
+        chunks = [QUESTIONS_PER_REQUEST] * (missing // QUESTIONS_PER_REQUEST)
+        if missing % QUESTIONS_PER_REQUEST:
+            chunks.append(missing % QUESTIONS_PER_REQUEST)
+        chunks[-1] += QUESTION_SLACK
+
+        # Identical parallel prompts tend to return the same questions
+        hints = [
+            f"\nThis is part {i} of {len(chunks)}; cover a different aspect of {_normalize_topic(topic)} than the other parts."
+            for i in range(1, len(chunks) + 1)
+        ]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            results = pool.map(lambda args: self._request_questions(topic, level, *args), zip(chunks, hints))
+            questions = [q for result in results for q in result]
+        # Dedupe on this thread only, since it updates the session's seen questions
+        return self._dedupe(questions, missing)
+
+    def _generate(
+        self, topic: str, level: str, num_questions: int, first: Callable[[], Iterable[Dict]]
+    ) -> Iterator[Dict]:
+        """Yield a quiz from the cache, or from first() topped up to num_questions and then cached."""
+        cache_key = self._cache_key(topic, level, num_questions)
+        cached = self._load_cached(cache_key)
+        if cached is not None:
+            yield from self._dedupe(cached)
+            return
 
         questions = []
-        raw_questions = response.text.split("Q")[1:]  # Extract each question
+        for q in first():
+            questions.append(q)
+            yield q
+            if len(questions) == num_questions:
+                break
+
+        # Top up only the missing questions instead of re-requesting the whole quiz
+        attempts = 0
+        while len(questions) < num_questions and attempts < MAX_TOP_UP_ATTEMPTS:
+            missing = num_questions - len(questions)
+            self._warn(Fore.YELLOW + f"⚠️ Only {len(questions)} questions generated, requesting {missing} more..." + Style.RESET_ALL)
+            for q in self._top_up(topic, level, missing):
+                questions.append(q)
+                yield q
+            attempts += 1
 
-        for q in raw_questions:
-            try:
-                lines = q.strip().split("\n")
-                question_text = ""
-                code_snippet = ""
-                options = {}
-                correct = ""
-                explanation = ""
-
-                # Step 1: Extract question text
-                if ". " in lines[0]:
-                    question_text = lines[0].split(". ", 1)[1].strip()
-                else:
-                    continue
+        if len(questions) < num_questions:
+            self._warn(Fore.YELLOW + f"⚠️ Only {len(questions)} questions generated." + Style.RESET_ALL)
+            return
+        self._store_cached(cache_key, questions)
 
-                # Step 2: Extract code if present
-                if level in ["intermediate"]:
-                    code_lines = []
-                    in_code = False
-                    options_start_index = 1
-
-                    for idx, line in enumerate(lines[1:], start=1):
-                        if line.strip().startswith("```python"):
-                            in_code = True
-                            continue
-                        elif line.strip() == "```" and in_code:
-                            in_code = False
-                            options_start_index = idx + 1
-                            break
-                        elif in_code:
-                            code_lines.append(line)
-
-                    code_snippet = "\n".join(code_lines)
-                else:
-                    options_start_index = 1  # For beginner level (no code)
-
-                # Step 3: Parse options, correct answer, and explanation
+    @app.post("/generate-quiz")
+    def generate_quiz(self, topic: str, level: str, num_questions: int) -> List[Dict]:
+        """Generate quiz questions using Gemini API."""
+        # Large quizzes are fanned out over ceil(N / QUESTIONS_PER_REQUEST) parallel requests
+        return list(self._generate(topic, level, num_questions, lambda: self._top_up(topic, level, num_questions)))
+
+    def _streamed(self, topic: str, level: str, num_questions: int) -> Iterator[Dict]:
+        """Yield new questions from one streamed request as each arrives."""
+        model, request = self._request_for(topic, level, num_questions + QUESTION_SLACK)
+        for q in self._stream_questions(model, request):
+            if self._dedupe([q]):
+                yield q
+
+    def iter_quiz(self, topic: str, level: str, num_questions: int) -> Iterator[Dict]:
+        """Yield quiz questions one at a time while the Gemini response is still streaming."""
+        return self._generate(topic, level, num_questions, lambda: self._streamed(topic, level, num_questions))
+
+    def _produce_questions(
+        self, topic: str, level: str, num_questions: int, out: queue.Queue, stop: threading.Event
+    ):
+        """Feed streamed questions into out for run_quiz, ending with a None sentinel."""
+
+        def put(item) -> bool:
+            # Don't block forever on a full queue once the quiz has been abandoned
+            while not stop.is_set():
                 try:
-                    options = {
-                        "A": lines[options_start_index].split("A) ")[1].strip(),
-                        "B": lines[options_start_index + 1].split("B) ")[1].strip(),
-                        "C": lines[options_start_index + 2].split("C) ")[1].strip(),
-                        "D": lines[options_start_index + 3].split("D) ")[1].strip(),
-                    }
-                    correct = lines[options_start_index + 4].split("Correct: ")[1].strip().upper()
-                    explanation = lines[options_start_index + 5].split("Explanation: ")[1].strip()
-                except Exception as inner_e:
-                    print(Fore.YELLOW + f"Skipping poorly formatted question block: {inner_e}" + Style.RESET_ALL)
+                    out.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
                     continue
+            return False
+
+        _THREAD_STATE.stop = stop
+        try:
+            for q in self.iter_quiz(topic, level, num_questions):
+                if not put(q):
+                    return
+        except Exception as e:
+            self._warn(Fore.RED + f"❌ Error generating quiz: {e}" + Style.RESET_ALL)
+        put(None)
+
+    @contextlib.contextmanager
+    def _answer_input(self):
+        """Set up stdin for the whole quiz and yield its (wait_input, discard_input) functions."""
+        if os.name == "nt":
+            yield _wait_key_windows, _discard_keys_windows
+            return
+        if not sys.stdin.isatty():
+            # Piped input can't be put in cbreak mode, so answers are read a line at a time
+            yield _wait_line, _discard_nothing
+            return
 
-                questions.append(
-                    {
-                        "question": question_text,
-                        "code": code_snippet,
-                        "options": options,                          # add options a, b , c , d
-                        "correct": correct,
-                        "explanation": explanation,
-                    }
-                )
-            except Exception as e:
-                print(Fore.RED + f"❌ Error parsing question: {e}" + Style.RESET_ALL)
+        # cbreak mode delivers each keystroke immediately, so no Enter is needed.
+        # The terminal is switched once per quiz rather than once per question.
+        fd = sys.stdin.fileno()
+        old_attrs = termios.tcgetattr(fd)
+        try:
+            tty.setcbreak(fd)
+            yield _wait_key_posix, _discard_keys_posix
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old_attrs)
+
+    def _read_answer(self, time_per_question: int, wait_input) -> Optional[str]:
+        """Wait for an A-D answer on stdin, returning None if the time limit runs out."""
+        print(f"\n{Fore.CYAN}Your answer (A/B/C/D):{Style.RESET_ALL} ")
+        return self._countdown(time_per_question, wait_input)
+
+    def _countdown(self, time_per_question: int, wait_input) -> Optional[str]:
+        """Repaint the countdown once per second until wait_input returns a valid answer."""
+        # A monotonic deadline keeps repaint and input time from stretching the limit
+        deadline = time.monotonic() + time_per_question
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            seconds_left = math.ceil(remaining)
+            sys.stdout.write(self._TIMER_FMT % seconds_left)
+            sys.stdout.flush()
+            # Wake up either on input or when the displayed second ticks over
+            key = wait_input(remaining - (seconds_left - 1))
+            if key is None:
                 continue
+            if key == "":  # stdin closed
+                return None
 
-        if len(questions) < num_questions:
-            print(Fore.YELLOW + f"⚠️ Only {len(questions)} questions generated, retrying..." + Style.RESET_ALL)
-            return self.generate_quiz(topic, level, num_questions)
+            # Only the first typed character counts; keys and piped lines arrive the same way
+            answer = key.lstrip()[:1]
+            if not answer:
+                continue
+            if answer in self._VALID_ANSWERS:
+                answer = answer.upper()
+                print(answer)
+                return answer
+            print(Fore.RED + "\nInvalid choice. Please enter A, B, C, or D." + Style.RESET_ALL)
 
-        return questions
+        print(Fore.RED + "\nTime's up! Moving to next question..." + Style.RESET_ALL)
+        return None
 
     def run_quiz(self, topic: str, level: str, num_questions: int):
         """Run an interactive quiz session with a countdown timer."""
@@ -171,91 +826,84 @@ class QuizAgent:
             + f"\nGenerating a {level} level quiz on {topic}..."
             + Style.RESET_ALL
         )
-        questions = self.generate_quiz(topic, level, num_questions)
+        # A background producer streams questions into a small queue, so the next
+        # question is generated while the user is still answering the current one
+        question_queue = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce_questions,
+            args=(topic, level, num_questions, question_queue, stop),
+            daemon=True,
+        )
+        # Producer warnings are held and shown between questions, not over the countdown
+        self._held_warnings = queue.SimpleQueue()
+
+        def questions() -> Iterator[Dict]:
+            for q in iter(question_queue.get, None):
+                self._print_held_warnings()
+                yield q
+            self._print_held_warnings()
+
+        producer.start()
+        try:
+            # Ctrl+C can also land while waiting on the producer between questions
+            self._ask_questions(questions(), level, num_questions)
+        except KeyboardInterrupt:
+            print("\nQuiz terminated by user.")
+        finally:
+            stop.set()
+            self._held_warnings = None
+
+    def _ask_questions(self, questions: Iterator[Dict], level: str, num_questions: int):
+        """Ask each question in turn, then print the score and feedback."""
+        # Parallel lists: the loop only records input, grading happens afterwards
+        asked = []
+        user_answers = []
+        time_per_question = self.time_limits[level.lower()]
 
-        if not questions:
+        with self._answer_input() as (wait_input, discard_input):
+            for i, q in enumerate(questions, 1):                                        #174
+                # Build the whole question screen and write it in one call
+                lines = [Fore.GREEN + f"\nQuestion {i}/{num_questions}:" + Style.RESET_ALL, q["question"]]
+                if q["code"]:
+                    lines.append(Fore.YELLOW + q["code"] + Style.RESET_ALL)
+                lines.extend(f"{opt}) {text}" for opt, text in zip("ABCD", q["options"]))
+                print("\n".join(lines))
+
+                # Keys pressed while waiting for this question must not answer it
+                discard_input()
+                answer = self._read_answer(time_per_question, wait_input)
+                if not answer:
+                    answer = "TIMEOUT"
+
+                asked.append(q)
+                user_answers.append(answer)
+
+        if not asked:
             print(Fore.RED + "Failed to generate quiz questions." + Style.RESET_ALL)
             return
 
-        score = 0
-        answers = []
-        time_per_question = self.time_limits[level.lower()]
-
-        for i, q in enumerate(questions, 1):                                            #174
-            print(Fore.GREEN + f"\nQuestion {i}/{num_questions}:" + Style.RESET_ALL)
-            print(q["question"])
-
-            if q["code"]:
-                print(Fore.YELLOW + q["code"] + Style.RESET_ALL)
-
-            for opt, text in q["options"].items():
-                print(f"{opt}) {text}")
-
-            answer = None
-            timer_expired = [False]
-
-            def countdown_timer():
-                """Function to handle countdown timer."""
-                for remaining in range(time_per_question, 0, -1):
-                    if not timer_expired[0]:  
-                        print(
-                            Fore.YELLOW
-                            + f"\rTime remaining: {remaining} seconds "
-                            + Style.RESET_ALL,
-                            end="",
-                            flush=True,
-                        )
-                        time.sleep(1)
-                if not timer_expired[0]:  
-                    timer_expired[0] = True
-                    print(
-                        Fore.RED
-                        + "\nTime's up! Moving to next question..."
-                        + Style.RESET_ALL
-                    )
-
-            timer_thread = threading.Thread(target=countdown_timer)
-            timer_thread.start()
-
-            try:
-                while not timer_expired[0]:
-                    answer = (
-                        input(f"\n{Fore.CYAN}Your answer (A/B/C/D):{Style.RESET_ALL} ")
-                        .upper()
-                        .strip()
-                    )
-                    if answer in ["A", "B", "C", "D"]:
-                        timer_expired[0] = True  
-                        break
-                    else:
-                        print(
-                            Fore.RED
-                            + "Invalid choice. Please enter A, B, C, or D."
-                            + Style.RESET_ALL
-                        )
-            except KeyboardInterrupt:
-                print("\nQuiz terminated by user.")
-                return
-
-            if not answer:
-                answer = "TIMEOUT"
-
-            answers.append({"question_num": i, "user_answer": answer, "correct_answer": q["correct"], "explanation": q["explanation"]})
-
-            if answer == q["correct"]:
-                score += 1
-
-            timer_thread.join()  
-
-        print(Fore.CYAN + "\n=== Quiz Results ===" + Style.RESET_ALL)
-        print(f"Score: {score}/{num_questions}")
-        
-        print(Fore.CYAN + "\n=== Detailed Feedback ===" + Style.RESET_ALL)
-        for ans in answers:
-            print(f"\nQuestion {ans['question_num']}:")
-            print(f"Your answer: {ans['user_answer']}")
-            print(f"Correct answer: {ans['correct_answer']}")
-            print(f"Explanation: {ans['explanation']}")
+        # Grade in one pass after the interactive loop
+        correct_answers = [q["correct"] for q in asked]
+        score = sum(map(operator.eq, user_answers, correct_answers))
+        timed_out = user_answers.count("TIMEOUT")
+
+        # Top-ups can give up short, so grade against what was actually asked
+        lines = [
+            Fore.CYAN + "\n=== Quiz Results ===" + Style.RESET_ALL,
+            f"Score: {score}/{len(asked)}",
+        ]
+        if len(asked) < num_questions:
+            lines.append(f"Only {len(asked)} of the {num_questions} requested questions could be generated.")
+        if timed_out:
+            lines.append(f"Unanswered (time ran out): {timed_out}")
+        lines.append(Fore.CYAN + "\n=== Detailed Feedback ===" + Style.RESET_ALL)
+        for i, (q, answer) in enumerate(zip(asked, user_answers), 1):
+            lines.append(f"\nQuestion {i}:")
+            lines.append(f"Your answer: {answer}")
+            lines.append(f"Correct answer: {q['correct']}")
+            lines.append(f"Explanation: {q['explanation']}")
+        print("\n".join(lines))
 
 # if __name__ == "__main__":
 #     quiz_agent = QuizAgent()
@@ -286,11 +934,13 @@ app.add_middleware(
     allow_headers=["*"],  # allow all headers
 )
 
+
 class QuizRequest(BaseModel):
     topic: str
     question_number: int
     level: str
 
+
 @app.post("/generate-quiz")
 def generate_quiz(data: QuizRequest):
     quiz_agent = QuizAgent()
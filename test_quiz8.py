@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from quiz8 import QuizAgent
+
+
+def make_agent():
+    # The text parser needs no Gemini client, so skip __init__ and its API key check
+    agent = QuizAgent.__new__(QuizAgent)
+    agent._held_warnings = None
+    return agent
+
+
+def question_block(number, label):
+    return (
+        f"{label}\n"
+        f"A) option {number}a\n"
+        f"B) option {number}b\n"
+        f"C) option {number}c\n"
+        f"D) option {number}d\n"
+        f"Correct: {'ABC'[number - 1]}\n"
+        f"Explanation: explanation {number}\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "labels",
+    [
+        ["**Q1.** Question 1?", "**Q2.** Question 2?", "**Q3.** Question 3?"],
+        ["Q1. Question 1?", "**Q2.** Question 2?", "Q3. Question 3?"],
+        ["## Q1. Question 1?", "## Q2. Question 2?", "## Q3. Question 3?"],
+    ],
+)
+def test_markdown_numbering_starts_a_new_block(labels):
+    text = "".join(question_block(n, label) for n, label in enumerate(labels, 1))
+
+    questions = make_agent()._parse_text(text)
+
+    assert [q["question"] for q in questions] == ["Question 1?", "Question 2?", "Question 3?"]
+    assert [q["correct"] for q in questions] == ["A", "B", "C"]
+    assert [q["options"][0] for q in questions] == ["option 1a", "option 2a", "option 3a"]
+    assert [q["explanation"] for q in questions] == ["explanation 1", "explanation 2", "explanation 3"]
+
+
+def test_repeated_labels_skip_the_block():
+    # Two questions merged into one block must not mix their fields
+    text = question_block(1, "Q1. Question 1?") + question_block(2, "Question 2?")
+
+    assert make_agent()._parse_text(text) == []